@@ -1,18 +1,36 @@
 import collections
+import heapq
 import math
 import multiprocessing
 import os
 import random
 import time
 import traceback
-from copy import copy
-from typing import Tuple, Set, Optional, Union, Any, List
-from queue import PriorityQueue
+from typing import Optional, Union, Any
+
+import numpy as np
 
 from models import Action, BasePlanner, Heuristic, DetourPlannerPhase, AstarHighLevelPlannerType
-from util import getManhattanDistance, get_neighbors, DistanceMap, get_valid_forwards_neighbor_cell, \
+from util import get_neighbors, DistanceMap, get_valid_forwards_neighbor_cell, \
     get_robot_position_map
 
+RESERVATION_TIME_BITS = 20  # leaves room for far longer time horizons than we ever use
+RESERVATION_CELL_BITS = 22  # fits maps with up to ~4M cells
+
+# action for an orientation change, indexed by (new - previous) & 3
+# delta 0 = no turn, 2 = half turn (impossible in one step) - both leave the planned action untouched
+TURN_ACTIONS = (None, Action.CR.value, None, Action.CCR.value)
+
+
+def reservation_key(start: int, end: int, time_step: int) -> int:
+    """
+    pack a (start cell, end cell, timestep) reservation into a single int
+    hashing one int is much cheaper than hashing a 3-tuple, and is_reserved probes the
+    reservation table for every expanded neighbor (-1 cell sentinels are shifted to 0)
+    """
+    return (start + 1) << (RESERVATION_CELL_BITS + RESERVATION_TIME_BITS) | (end + 1) << RESERVATION_TIME_BITS \
+        | time_step
+
 
 class SpaceTimeAStarPlanner(BasePlanner):
     debug_mode = False
@@ -22,12 +40,25 @@ class SpaceTimeAStarPlanner(BasePlanner):
                  heuristic: Heuristic = Heuristic.TRUE_DISTANCE,
                  high_level_planner=AstarHighLevelPlannerType.PRIORITY) -> None:
         super().__init__(pyenv, "Space-Time-A-Star-Planner")
-        self.reservation: Set[Tuple[int, int, int]] = set()
-        # (cell id 1, cell id 2, timestep relative to current timestep [one_based])
-        self.edge_hash_to_robot_id: dict[Tuple[int, int, int], int] = {}
-        # (cell id, -1, timestep [one_based]): robot id
-        self.next_actions: list[list[int]]
-        # next action for each robot
+        self.edge_hash_to_robot_id: dict[int, int] = {}
+        # reservation_key(cell id 1, cell id 2, timestep relative to current timestep [one_based]): robot id
+        # this dict is the reservation table itself - key presence means reserved, the value is the owner
+        self.robot_to_reservations: dict[int, set[int]] = collections.defaultdict(set)
+        # robot id: reservation keys the robot holds - reverse index so revocations don't scan the whole table
+        self.next_actions: np.ndarray
+        # next action for each robot and planned step - int8 array of shape (replanning_period, num_of_agents)
+        self._next_actions_buf: Optional[np.ndarray] = None  # reused backing buffer, see reset_next_actions
+        self._closed: Optional[bytearray] = None  # flat closed table indexed by state hash and (clamped) timestep
+        self._dirty_closed_indices: list[int] = []  # entries of _closed that the previous search marked
+        self._neighbor_lut: Optional[list[tuple[tuple[int, int], ...]]] = None
+        # successor states (incl. waiting) per position-orientation hash - the map is static, so build it once
+        self._forward_cell_lut: Optional[list[int]] = None
+        # forward cell (or -1 if a wall blocks it) per position-orientation hash, built once like the lut above
+        self._cell_rows: Optional[list[int]] = None  # row per cell id, avoids div/mod in the manhattan heuristic
+        self._cell_cols: Optional[list[int]] = None
+        self._manhattan_h_tables: dict[int, list[int]] = {}  # target cell: manhattan distance per cell
+        self._path_cache: dict[tuple[int, int, int], list[tuple[int, int]]] = {}
+        # (start, orientation, goal): last globally shortest path - goals repeat in lifelong planning
         self.timeout_steps = 0
         self.last_planning_step = -math.inf
         self.distance_maps = {}  # in here we store the distance map for each target cell while ignoring robots
@@ -46,6 +77,17 @@ class SpaceTimeAStarPlanner(BasePlanner):
         if r := os.getenv("restarts"):
             self.restart_count = int(r)
 
+        # number of worker processes that evaluate restart priority orders in parallel (0 = restart serially)
+        self.parallel_restart_processes = 0
+        if p := os.getenv("parallelRestarts"):
+            self.parallel_restart_processes = int(p)
+
+        # number of worker processes that precompute unconstrained shortest paths before the serial
+        # priority pass (0 = plan everything serially) - see precompute_paths_in_parallel
+        self.parallel_planning_processes = 0
+        if p := os.getenv("parallelPlanningBatches"):
+            self.parallel_planning_processes = int(p)
+
         self.shuffle_on_first_replan = False
         if s := os.getenv("shuffleOnFirstReplan"):
             self.shuffle_on_first_replan = s == "True"
@@ -68,6 +110,9 @@ class SpaceTimeAStarPlanner(BasePlanner):
             else:
                 raise RuntimeError(f"unknown high level planner {h} of type {type(h)}")
 
+        self._rng = np.random.default_rng(42)  # used for the restart shuffles, cheaper per call than random
+        self._perm_buf: Optional[np.ndarray] = None  # reused permutation buffer, allocated on first plan
+
         self.VISUALIZE = visualize
         if visualize:
             from visualization_a_star import AStarVisualizer
@@ -78,8 +123,37 @@ class SpaceTimeAStarPlanner(BasePlanner):
     def initialize(self, preprocess_time_limit: int):
         # todo use initialization time to autotune parameters (replanning_period, time_horizon, try_fix_waiting_robots,
         #  parallelization, ...)
-        # todo preprocess distance maps
-        return True  # todo: implement preprocessing or optimal pathfinding
+        if preprocess_time_limit and preprocess_time_limit > 0:
+            self.precompute_distance_maps(preprocess_time_limit)
+        return True  # todo: implement optimal pathfinding
+
+    def precompute_distance_maps(self, preprocess_time_limit: int, time_margin_factor=0.9):
+        """
+        build the distance maps for all currently known goal cells before planning starts
+        get_true_distance would otherwise construct them lazily on the planning critical path
+        :param preprocess_time_limit: preprocessing budget in seconds
+        :param time_margin_factor: fraction of the budget that may actually be used
+        """
+        if self.heuristic != Heuristic.TRUE_DISTANCE:
+            return
+        deadline = time.time() + preprocess_time_limit * time_margin_factor
+        jobs = []
+        queued_targets = set(self.distance_maps)
+        for robot_id in range(self.env.num_of_agents):
+            state = self.env.curr_states[robot_id]
+            for goal in self.env.goal_locations[robot_id]:
+                if goal[0] not in queued_targets:
+                    queued_targets.add(goal[0])
+                    jobs.append((self.env, state.location, state.orientation, goal[0]))
+        if not jobs:
+            return
+        with multiprocessing.Pool() as pool:
+            for d_map in pool.imap_unordered(_get_precomputed_distance_map_for_args, jobs):
+                self.distance_maps[d_map.target] = d_map
+                if time.time() >= deadline:
+                    pool.terminate()  # maps that were not finished in time are built lazily on first use
+                    break
+        print(f"precomputed {len(self.distance_maps)} of {len(jobs)} distance maps")
 
     def plan(self, time_limit) -> list[int]:
         if time_limit == 2147483647:  # c++ passes this if no time limit is set (max int value)
@@ -93,7 +167,28 @@ class SpaceTimeAStarPlanner(BasePlanner):
                 print(traceback.format_exc())
                 raise e
         else:
-            return self.next_actions.pop(0)
+            return self.pop_next_actions()
+
+    def reset_next_actions(self):
+        """
+        point next_actions at the reused planning buffer, refilled with the wait move
+        the low level planners are called many times per replan (restarts), so one persistent buffer plus
+        a C-level fill replaces a fresh allocation per call - best solutions are snapshotted with .copy()
+        """
+        shape = (self.replanning_period, len(self.env.curr_states))
+        if self._next_actions_buf is None or self._next_actions_buf.shape != shape:
+            self._next_actions_buf = np.empty(shape, dtype=np.int8)
+        self._next_actions_buf.fill(Action.W.value)
+        self.next_actions = self._next_actions_buf
+
+    def pop_next_actions(self) -> list[int]:
+        """
+        take the actions for the next step and keep the remaining planned steps
+        :return: the next action for each robot
+        """
+        next_actions = self.next_actions[0].tolist()  # the c++ side expects a plain list of ints
+        self.next_actions = self.next_actions[1:]
+        return next_actions
 
     def log(self, msg: str, robot_id=None, level=0):
         if robot_id not in [None, 185, 130, 145]:
@@ -148,6 +243,27 @@ class SpaceTimeAStarPlanner(BasePlanner):
             self.distance_maps[d_map.target] = d_map
         print(self.distance_maps)
 
+    @staticmethod
+    def hash_priority_order(priority_order: tuple[int, ...]) -> int:
+        """
+        dedup hash of a priority order - hashing the raw int32 bytes runs in C and matches the hashes
+        produced by next_random_priority_order
+        :param priority_order: permutation of the robot ids
+        :return: hash for the tried_priority_orders set
+        """
+        return hash(np.asarray(priority_order, dtype=np.int32).tobytes())
+
+    def next_random_priority_order(self) -> tuple[tuple[int, ...], int]:
+        """
+        draw a new random priority order by shuffling a preallocated buffer in place
+        avoids building a fresh list per restart iteration and uses the numpy rng, which shuffles in C
+        :return: the priority order as a tuple plus its dedup hash
+        """
+        if self._perm_buf is None or len(self._perm_buf) != self.env.num_of_agents:
+            self._perm_buf = np.arange(self.env.num_of_agents, dtype=np.int32)
+        self._rng.shuffle(self._perm_buf)
+        return tuple(self._perm_buf.tolist()), hash(self._perm_buf.tobytes())
+
     def plan_with_random_restarts(self, time_limit: Optional[int] = None, time_margin_factor=2) -> list[int]:
         # self.precompute_heuristic_values()
         start = time.time()
@@ -162,12 +278,14 @@ class SpaceTimeAStarPlanner(BasePlanner):
             0, time_limit, priority_order)
 
         if not self.random_restarts:
-            return self.next_actions.pop(0)
+            return self.pop_next_actions()
 
-        tried_priority_orders = {priority_order}
+        # only the hashes of the tried permutations are kept: membership tests then compare one int instead of
+        # re-hashing a num_of_robots-sized tuple, and the set does not hold on to the tuples themselves
+        tried_priority_orders = {self.hash_priority_order(priority_order)}
         min_waiting_robots = waiting_robots_count
         min_path_length_sum = path_length_sum
-        best_next_actions = copy(self.next_actions)
+        best_next_actions = self.next_actions.copy()
         got_best_actions_through_fix_step = False
         best_iteration = 0
         # todo: maybe prioritize
@@ -176,7 +294,23 @@ class SpaceTimeAStarPlanner(BasePlanner):
         number_of_restarts = None if self.restart_count is None else self.restart_count - 1
         # number_of_restarts = min(number_of_restarts, math.factorial(num_of_robots) - 1)
         iteration_count = 0
-        # todo: parallelize
+        if self.parallel_restart_processes:
+            if self.try_fix_waiting_robots and waiting_robot_ids:
+                # try the fix step for the first solution once before handing the restarts over to the workers
+                _, new_path_length_sum, waiting_robots_count, waiting_robot_ids = self.priority_planner(
+                    time_limit, priority_order, try_fix_stuck_robots=waiting_robot_ids)
+                if waiting_robots_count < min_waiting_robots or (
+                        waiting_robots_count == min_waiting_robots and new_path_length_sum < min_path_length_sum):
+                    min_waiting_robots = waiting_robots_count
+                    min_path_length_sum = new_path_length_sum
+                    best_next_actions = self.next_actions.copy()
+            best_next_actions, iteration_count = self.evaluate_priority_orders_in_parallel(
+                start, time_limit, time_margin_factor, number_of_restarts, tried_priority_orders,
+                min_waiting_robots, min_path_length_sum, best_next_actions)
+            self.next_actions = best_next_actions
+            next = self.pop_next_actions()
+            print(f"iteration count: {iteration_count}")
+            return next
         last_step_was_fix_step = False
         while True:
             iteration_count += 1
@@ -196,13 +330,11 @@ class SpaceTimeAStarPlanner(BasePlanner):
                 last_step_was_fix_step = True  # makes sure fix is only tried once per priority order
             else:
                 while True:
-                    new_priority_order = list(priority_order)
-                    random.shuffle(
-                        new_priority_order)  # todo instead of random try to switch robots that had collisions in the last planning step
-                    new_priority_order = tuple(new_priority_order)
-                    if new_priority_order not in tried_priority_orders:
+                    # todo instead of random try to switch robots that had collisions in the last planning step
+                    new_priority_order, order_hash = self.next_random_priority_order()
+                    if order_hash not in tried_priority_orders:
                         priority_order = new_priority_order
-                        tried_priority_orders.add(priority_order)
+                        tried_priority_orders.add(order_hash)
                         break
                 _, new_path_length_sum, waiting_robots_count, waiting_robot_ids, processing_time = self.call_low_level_planner(
                     iteration_count, time_limit, priority_order)
@@ -212,12 +344,12 @@ class SpaceTimeAStarPlanner(BasePlanner):
                     waiting_robots_count == min_waiting_robots and new_path_length_sum < min_path_length_sum):
                 min_waiting_robots = waiting_robots_count
                 min_path_length_sum = new_path_length_sum
-                best_next_actions = copy(self.next_actions)
+                best_next_actions = self.next_actions.copy()
                 got_best_actions_through_fix_step = last_step_was_fix_step
                 if self.verbose:
                     best_iteration = iteration_count
         self.next_actions = best_next_actions
-        next = self.next_actions.pop(0)
+        next = self.pop_next_actions()
         print(f"iteration count: {iteration_count}")
         if self.debug_mode:
             print(f"best actions through fix step: {got_best_actions_through_fix_step}")
@@ -227,6 +359,65 @@ class SpaceTimeAStarPlanner(BasePlanner):
         #  lowest sum of path lengths, lowest number of waiting robots, lowest sum of h values
         #  (caution: when an agent reaches its goal, he will get a new target with a new bigger h)
 
+    def evaluate_priority_orders_in_parallel(self, start: float, time_limit: Optional[int], time_margin_factor: float,
+                                             number_of_restarts: Optional[int], tried_priority_orders: set[int],
+                                             min_waiting_robots: int, min_path_length_sum: int,
+                                             best_next_actions: np.ndarray) -> tuple[np.ndarray, int]:
+        """
+        evaluate random restart priority orders in a pool of worker processes and keep the best result
+        every permutation is an independent run of the low level planner, so the workers only need the current
+        env (plus the distance maps, to not recompute them) and send back the actions they planned
+        :param start: timestamp when planning started
+        :param time_limit: time limit in seconds
+        :param time_margin_factor: safety factor applied to the expected processing time of one order
+        :param number_of_restarts: stop after this many evaluations (may overshoot by one wave)
+        :param tried_priority_orders: hashes of the priority orders that were already evaluated
+        :param min_waiting_robots: number of waiting robots of the best solution so far
+        :param min_path_length_sum: path length sum of the best solution so far
+        :param best_next_actions: next actions of the best solution so far
+        :return: best next actions, number of evaluated priority orders
+        """
+        num_of_robots = self.env.num_of_agents
+        planner_args = {
+            "replanning_period": self.replanning_period,
+            "time_horizon": self.time_horizon,
+            "restarts": False,
+            "heuristic": self.heuristic,
+            "high_level_planner": self.high_level_planner,
+        }
+        iteration_count = 0
+        with multiprocessing.Pool(self.parallel_restart_processes, initializer=_initialize_restart_worker,
+                                  initargs=(self.env, planner_args, self.distance_maps)) as pool:
+            while True:
+                if time_limit and len(self.processing_times) > 0 and (time.time() - start) + max(
+                        self.processing_times) * time_margin_factor >= time_limit:
+                    break
+                if number_of_restarts and iteration_count >= number_of_restarts:
+                    break
+                wave = []
+                failed_shuffles = 0
+                while len(wave) < self.parallel_restart_processes and failed_shuffles < 10:
+                    new_priority_order, order_hash = self.next_random_priority_order()
+                    if order_hash in tried_priority_orders:
+                        # repeated shuffles are a sign that most orders were tried already -> give up eventually
+                        failed_shuffles += 1
+                        continue
+                    tried_priority_orders.add(order_hash)
+                    wave.append((iteration_count + len(wave) + 1, time_limit, new_priority_order))
+                if not wave:
+                    break
+                for next_actions, new_path_length_sum, waiting_robots_count, processing_time in \
+                        pool.imap_unordered(_evaluate_priority_order, wave):
+                    iteration_count += 1
+                    self.processing_times.append(processing_time)
+                    if waiting_robots_count < min_waiting_robots or (
+                            waiting_robots_count == min_waiting_robots
+                            and new_path_length_sum < min_path_length_sum):
+                        min_waiting_robots = waiting_robots_count
+                        min_path_length_sum = new_path_length_sum
+                        best_next_actions = next_actions
+        return best_next_actions, iteration_count
+
     def get_heuristic_value(self, start: int, orientation: int, end: int) -> int:
         """
         get the heuristic value for the given start and end cell
@@ -238,10 +429,34 @@ class SpaceTimeAStarPlanner(BasePlanner):
         if self.heuristic == Heuristic.TRUE_DISTANCE:
             return self.get_true_distance(start, orientation, end)
         elif self.heuristic == Heuristic.MANHATTAN:
-            return getManhattanDistance(self.env, start, end)
+            # same result as getManhattanDistance, but reads the precomputed row/col of each cell
+            # instead of deriving them with two divisions per call
+            if self._cell_rows is None or len(self._cell_rows) != len(self.env.map):
+                number_of_cells = len(self.env.map)
+                self._cell_rows = (np.arange(number_of_cells) // self.env.cols).tolist()
+                self._cell_cols = (np.arange(number_of_cells) % self.env.cols).tolist()
+            rows = self._cell_rows
+            cols = self._cell_cols
+            return abs(rows[start] - rows[end]) + abs(cols[start] - cols[end])
         else:
             raise RuntimeError(f"unknown heuristic {self.heuristic}")
 
+    def get_manhattan_h_table(self, end: int) -> list[int]:
+        """
+        manhattan distances from every cell to the given target cell, cached per target
+        the table is filled with one vectorized numpy expression instead of a python call per cell
+        :param end: the target cell index
+        :return: list of distances indexed by cell id
+        """
+        number_of_cells = len(self.env.map)
+        table = self._manhattan_h_tables.get(end)
+        if table is None or len(table) != number_of_cells:
+            rows = np.arange(number_of_cells) // self.env.cols
+            cols = np.arange(number_of_cells) % self.env.cols
+            table = (np.abs(rows - rows[end]) + np.abs(cols - cols[end])).tolist()
+            self._manhattan_h_tables[end] = table
+        return table
+
     def get_true_distance(self, start: int, start_orientation: int, end: int) -> int:
         """
         get the true distance between two cells
@@ -274,92 +489,228 @@ class SpaceTimeAStarPlanner(BasePlanner):
         :param end: the target cell index
         :return: the shortest path if it exists - list of (node index, orientation) tuples
         """
+        # path memoization: (start, orientation, goal) triples recur in lifelong planning, and a cached
+        # globally shortest path can be reused as long as the current reservation table does not block it
+        use_cache = self.heuristic == Heuristic.TRUE_DISTANCE  # h is exact -> optimality can be verified
+        if use_cache:
+            cached_path = self._path_cache.get((start, start_direct, end))
+            if cached_path is not None and self.is_path_conflict_free(start, cached_path, robot_id):
+                return cached_path
+
         path = []
-        open_list = PriorityQueue()  # list of all cells to look at
-        all_nodes = {}  # loc+dict, t
+        open_list = []  # heap of all cells to look at - no need for a thread-safe PriorityQueue here
         parent = {}
 
+        # flat closed table instead of a set of (state hash, t) tuples: one byte per state and timestep.
+        # no reservation exists beyond the time horizon, so states there are time-independent and the
+        # time axis can be clamped to time_horizon + 1 - this keeps the table small although the search
+        # itself may run much deeper than the horizon
+        time_slots = self.time_horizon + 2
+        state_count = len(self.env.map) * 4  # number of distinct position-orientation hashes
+        table_size = state_count * time_slots
+        if self._closed is None or len(self._closed) != table_size:
+            self._closed = bytearray(table_size)
+        else:
+            for index in self._dirty_closed_indices:
+                self._closed[index] = 0  # only reset what the previous search touched
+        closed = self._closed
+        self._dirty_closed_indices = dirty_closed_indices = []
+        h_cache: dict[int, int] = {}  # heuristic values are constant per cell+orientation while end is fixed
+        # manhattan ignores the orientation and is cheap to batch-compute: one vectorized numpy expression
+        # fills the whole per-target table, the loop below then reads h as a plain list index
+        h_table = self.get_manhattan_h_table(end) if self.heuristic == Heuristic.MANHATTAN else None
+
+        if self._neighbor_lut is None or len(self._neighbor_lut) != state_count:
+            self.build_neighbor_lut()
+
+        # bind everything the inner loop touches to locals - attribute lookups are resolved on every
+        # expansion otherwise, which is measurable interpreter overhead at millions of expansions per replan
+        neighbor_lut = self._neighbor_lut
+        edge_owner = self.edge_hash_to_robot_id
+        get_heuristic_value = self.get_heuristic_value
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        visualize = self.VISUALIZE
+        edge_shift = RESERVATION_CELL_BITS + RESERVATION_TIME_BITS  # for inlining reservation_key below
+        # beyond the time horizon no reservations exist, so the search becomes time-independent there and
+        # the true-distance map (a backward search from the goal) already knows the remaining shortest path
+        # -> the forward search can stop at the horizon and stitch the two halves together
+        stitch_at_horizon = self.heuristic == Heuristic.TRUE_DISTANCE
+        time_horizon = self.time_horizon
+
         if self.VISUALIZE:
             self.visualizer.reset()
 
         h = self.get_heuristic_value(start, start_direct, end)  # heuristic approximation
         g = 0  # distance traveled
-        node_info = (start, start_direct, g, h)
-        open_list.put((g + h, h, 0, node_info))
+        heappush(open_list, (g + h, h, start, start_direct, g))
         position_direction_hash = start * 4 + start_direct
         # why start * 4 + start_direct ?
         # because: this results in a unique hash of the postion/orientation (4 orientations -> if orientation changes: at least +1 or +3 at most; if cell changes: at least +4)
         # this is a hash that is used to check if a position/orientation-combination was already looked at
-        parent[(position_direction_hash, g)] = None  # safe the parent node
+        # parent keys pack (position-orientation hash, g) into one int: g is unique per state visit and
+        # hashing a single int is about twice as cheap as hashing a 2-tuple
+        parent[g * state_count + position_direction_hash] = None  # safe the parent node
 
-        while not open_list.empty():  # look at all cells in the open list
-            if self.VISUALIZE:
-                self.visualizer.commit_open_list([(n[3][0], n[3][2]) for n in open_list.queue])
+        while open_list:  # look at all cells in the open list
+            if visualize:
+                self.visualizer.commit_open_list([(n[2], n[4]) for n in open_list])
                 self.visualizer.new_step()
 
-            node = open_list.get()  # get the node with the lowest f value
-            f, h, node_id, current_node_info = node
-            position, orientation, g, h = current_node_info
+            # get the node with the lowest f value - the heap entries are flat tuples
+            # (keeping a nested node-info tuple per entry was measurable overhead in this loop)
+            f, h, position, orientation, g = heappop(open_list)
             current_time_step = g  # it is the same, when planning was started in time_step 0
             next_time_step = current_time_step + 1
 
-            if (position * 4 + orientation, g) in all_nodes:
+            position_direction_hash = position * 4 + orientation
+            closed_index = position_direction_hash * time_slots + (g if g < time_slots else time_slots - 1)
+            if closed[closed_index]:
                 continue  # skip if this node was already looked at - at the current time step
-            all_nodes[(position * 4 + orientation, g)] = current_node_info
+            closed[closed_index] = 1
+            dirty_closed_indices.append(closed_index)
+
+            if stitch_at_horizon and position != end and g >= time_horizon:
+                # h is exact for TRUE_DISTANCE and this node has the lowest f in the open list, so a path
+                # through it is a shortest path - read its unconstrained remainder off the distance map
+                suffix = self.walk_distance_map(position, orientation, end)
+                if suffix is not None:
+                    path = [None] * g
+                    node = (position, orientation, g)
+                    for index in range(g - 1, -1, -1):
+                        path[index] = (node[0], node[1])
+                        node = parent[node[2] * state_count + node[0] * 4 + node[1]]
+                    path += suffix
+                    break
+
             if position == end:
-                while True:  # yey, we found a path
-                    # todo: instead of returning the path here, we should first check if the path is at least as long as
-                    #  the time horizon, otherwise the robot would stop and block the cell it is on until the
-                    #  next planning step
-                    #  (or worse: the waiting cell is already reserved -> the found route would get canceled))
-                    path.append((current_node_info[0], current_node_info[1]))  # append position, orientation to path
-                    current_node_info = parent[(current_node_info[0] * 4 + current_node_info[1], current_node_info[
-                        2])]  # previous node is the parent -> get parent by position hash, g (dist from start)
-                    if current_node_info is None:
-                        break  # start node was reached which has no parent
-                path.pop()  # remove the start node
-                path.reverse()
+                # yey, we found a path - g equals the path length, so the list can be preallocated and
+                # filled back to front (no append growth, no reverse); the start node is left out
+                # todo: instead of returning the path here, we should first check if the path is at least as long as
+                #  the time horizon, otherwise the robot would stop and block the cell it is on until the
+                #  next planning step
+                #  (or worse: the waiting cell is already reserved -> the found route would get canceled))
+                path = [None] * g
+                node = (position, orientation, g)
+                for index in range(g - 1, -1, -1):
+                    path[index] = (node[0], node[1])  # position, orientation
+                    # previous node is the parent -> get parent by packed position hash + g (dist from start)
+                    node = parent[node[2] * state_count + node[0] * 4 + node[1]]
                 break
 
-            neighbors = get_neighbors(self.env, position, orientation)
-            neighbors.append((position, orientation))  # also check if we can wait on the current field
-            for neighbor in neighbors:
+            for neighbor_location, neighbor_direction in neighbor_lut[position_direction_hash]:
                 # it's not really the neighbor we are checking, it is more the next possible position+orientation
-                neighbor_location, neighbor_direction = neighbor
 
-                if self.is_reserved(position, neighbor_location, next_time_step, current_robot_id=robot_id):
+                # inlined is_reserved: the method call itself showed up in profiles of this loop
+                cell_key = (neighbor_location + 1) << edge_shift | next_time_step
+                if edge_owner.get(cell_key, robot_id) != robot_id:
+                    continue  # the target cell is already reserved by another robot
+                if neighbor_location != position and \
+                        ((neighbor_location + 1) << edge_shift | (position + 1) << RESERVATION_TIME_BITS
+                         | next_time_step) in edge_owner:
+                    # the edge neighbor --to--> position is already reserved in the next timestep
+                    # (waits and rotations stay on their cell - add_reservation never stores same-cell edges,
+                    # so the edge probe is only needed for actual moves)
                     continue
 
-                neighbor_key = (neighbor_location * 4 + neighbor_direction, next_time_step)
+                neighbor_hash = neighbor_location * 4 + neighbor_direction
+                neighbor_closed_index = neighbor_hash * time_slots + (
+                    next_time_step if next_time_step < time_slots else time_slots - 1)
 
-                if neighbor_key in all_nodes:
-                    old = all_nodes[neighbor_key]
-                    if g + 1 < old[2]:  # todo what exactly is this good for?
-                        old = (old[0], old[1], g + 1, old[3], old[4])
-                else:
+                if not closed[neighbor_closed_index]:
                     next_g = g + 1
-                    next_h = self.get_heuristic_value(neighbor_location, neighbor_direction, end)
-                    next_node_info = (
-                        neighbor_location,
-                        neighbor_direction,
-                        next_g,
-                        next_h,
-                    )
-                    next_f = next_g + next_h
-                    open_list.put(
-                        (next_f, next_h, 0, next_node_info)
+                    if h_table is not None:
+                        next_h = h_table[neighbor_location]
+                    else:
+                        next_h = h_cache.get(neighbor_hash)
+                        if next_h is None:
+                            next_h = get_heuristic_value(neighbor_location, neighbor_direction, end)
+                            h_cache[neighbor_hash] = next_h
+                    heappush(
+                        open_list, (next_g + next_h, next_h, neighbor_location, neighbor_direction, next_g)
                     )
 
-                    parent[
-                        (neighbor_location * 4 + neighbor_direction, next_g)
-                    ] = current_node_info
+                    parent[next_g * state_count + neighbor_hash] = (position, orientation, g)
 
-            if self.VISUALIZE:
+            if visualize:
                 self.visualizer.update_data(self.env, open_list, position, orientation, g)
-        if self.VISUALIZE:
+        if visualize:
             self.visualizer.save_visualizations(self.env, start, end)
+        if use_cache and path and len(path) == self.get_true_distance(start, start_direct, end):
+            # only globally shortest paths are cached - anything longer was shaped by the reservations
+            # of this particular run and would not be worth revalidating later
+            if len(self._path_cache) > 4 * self.env.num_of_agents:
+                self._path_cache.clear()  # simple size bound - goals cycle slowly, so resets are rare
+            self._path_cache[(start, start_direct, end)] = path
         return path
 
+    def is_path_conflict_free(self, last_loc: int, path: list[tuple[int, int]], robot_id: int) -> bool:
+        """
+        probe the reservation table along the whole path the same way the reserve loop would,
+        including the trailing waits when the path is shorter than the time horizon
+        :param last_loc: current location of the robot
+        :param path: the path - list of (cell index, orientation) tuples
+        :param robot_id: id of the robot (its own reservations do not count as conflicts)
+        :return: true if no step of the path is blocked
+        """
+        for step in range(self.time_horizon):
+            p = path[step] if step < len(path) else path[-1]
+            if self.is_reserved(last_loc, p[0], step + 1, current_robot_id=robot_id):
+                return False
+            last_loc = p[0]
+        return True
+
+    def walk_distance_map(self, position: int, orientation: int, end: int) -> Optional[list[tuple[int, int]]]:
+        """
+        follow the true-distance map downhill from the given state to the goal
+        every step picks a successor whose distance is exactly one smaller, so the result is a shortest
+        path that ignores reservations (only valid where no reservations can exist, i.e. past the horizon)
+        :param position: cell index to start from
+        :param orientation: orientation to start from
+        :param end: the target cell index
+        :return: list of (node index, orientation) tuples excluding the start state, or None if the walk
+        gets stuck (should not happen with a consistent distance map - the caller then keeps searching)
+        """
+        suffix = []
+        while position != end:
+            distance = self.get_true_distance(position, orientation, end)
+            for neighbor_location, neighbor_direction in self._neighbor_lut[position * 4 + orientation]:
+                if neighbor_location == position and neighbor_direction == orientation:
+                    continue  # waiting never gets the robot closer to the goal
+                if self.get_true_distance(neighbor_location, neighbor_direction, end) == distance - 1:
+                    position, orientation = neighbor_location, neighbor_direction
+                    suffix.append((position, orientation))
+                    break
+            else:
+                return None
+        return suffix
+
+    def build_neighbor_lut(self):
+        """
+        precompute the successor states for every position-orientation combination
+        get_neighbors re-derives them from the map on every A* expansion although the map never changes,
+        so one lookup table built up front replaces a function call plus a list allocation in the hot loop
+        """
+        lut = []
+        for location in range(len(self.env.map)):
+            for direction in range(4):
+                neighbors = get_neighbors(self.env, location, direction)
+                neighbors.append((location, direction))  # also check if we can wait on the current field
+                lut.append(tuple(neighbors))
+        self._neighbor_lut = lut
+
+    def build_forward_cell_lut(self):
+        """
+        precompute the valid forward cell for every position-orientation combination
+        the prereservation pass asks this once per robot per replan, and the answer only depends on the map
+        """
+        lut = []
+        for location in range(len(self.env.map)):
+            for direction in range(4):
+                cell = get_valid_forwards_neighbor_cell(self.env, location, direction)
+                lut.append(-1 if cell is None else cell)
+        self._forward_cell_lut = lut
+
     def is_reserved(self, start: int, end: int, time_step: int, current_robot_id=None) -> bool:
         """
         check if the target cell is already reserved + check if the edge is reserved
@@ -367,14 +718,14 @@ class SpaceTimeAStarPlanner(BasePlanner):
         """
         if end == -1:
             end = start
-        if (end, -1, time_step) in self.reservation:
-            if current_robot_id is None:
-                return True  # the end cell is already reserved
+        owner = self.edge_hash_to_robot_id.get(reservation_key(end, -1, time_step))
+        if owner is not None:
             # only return True if the robot that reserved the cell is not the current robot
-            if self.edge_hash_to_robot_id[(end, -1, time_step)] != current_robot_id:
-                return True
+            if current_robot_id is None or owner != current_robot_id:
+                return True  # the end cell is already reserved
 
-        if (end, start, time_step) in self.reservation:
+        # add_reservation never stores same-cell edges, so waits need no edge probe
+        if end != start and reservation_key(end, start, time_step) in self.edge_hash_to_robot_id:
             return True  # the edge end --to--> start is already reserved in the next timestep
         return False
 
@@ -391,8 +742,8 @@ class SpaceTimeAStarPlanner(BasePlanner):
         """
         # todo: stop when time_limit is reached?
         # todo: replan (or only plan for specific agents) when some agent reached his goal
-        self.reservation = set()
         self.edge_hash_to_robot_id = {}
+        self.robot_to_reservations = collections.defaultdict(set)
 
         # todo implement try_fix_collisions: make the first collider in the group wait one step and make the robot wait the first step he would normally move forward
         #  and then make his moves planned in the previous iteration,
@@ -403,34 +754,41 @@ class SpaceTimeAStarPlanner(BasePlanner):
         waiting_robot_ids = []
         collision_groups: list[list[int]] = []  # list of lists of robot ids that are in a collision group
 
-        self.next_actions = [[Action.W.value] * len(self.env.curr_states) for _ in range(self.replanning_period)]
+        self.reset_next_actions()
 
         self.prereserve_cells_based_on_robot_positions(try_fix_stuck_robots)
 
+        precomputed_paths = {}
+        if self.parallel_planning_processes and self.heuristic == Heuristic.TRUE_DISTANCE:
+            precomputed_paths = self.precompute_paths_in_parallel(robot_order)
+
+        curr_states = self.env.curr_states
+        goal_locations = self.env.goal_locations
         # plan and reserve path for one robot at a time
         for robot_id in robot_order or range(self.env.num_of_agents):
+            state = curr_states[robot_id]  # fetched once instead of per attribute chain below
             # reserve waiting cell for all robots that don't have any goals left
             # todo: instead of waiting,
             #  try to find a path that avoids collisions by setting the robots priority to the lowest
             #  and / or perform depth first search to find a path that avoids collisions
-            if not self.env.goal_locations[robot_id]:
-                for step in range(self.time_horizon):
-                    self.add_reservation(self.env.curr_states[robot_id].location, -1, step, robot_id)
+            if not goal_locations[robot_id]:
+                self.add_waiting_reservations(state.location, range(self.time_horizon), robot_id)
                 continue
 
-            path = self.space_time_plan(  # get the shortest possible path
-                self.env.curr_states[robot_id].location,
-                self.env.curr_states[robot_id].orientation,
-                self.env.goal_locations[robot_id][0][0],
-                robot_id
-            )
+            path = precomputed_paths.get(robot_id)
+            if path is None or not self.is_path_conflict_free(state.location, path, robot_id):
+                path = self.space_time_plan(  # get the shortest possible path
+                    state.location,
+                    state.orientation,
+                    goal_locations[robot_id][0][0],
+                    robot_id
+                )
 
-            last_loc = self.env.curr_states[robot_id].location
+            last_loc = state.location
             if path:
                 self.log("path found", robot_id)
                 try:
-                    self.reserve_path_if_possible(last_loc, path, robot_id)
-                    self.update_next_actions(path, robot_id)
+                    self.reserve_path_and_update_actions(last_loc, path, robot_id)
                     path_length_sum += len(path)  # todo decrease sum when a path gets cancelled
                     self.log(f"reserved path", robot_id)
                 except RuntimeError:
@@ -460,14 +818,41 @@ class SpaceTimeAStarPlanner(BasePlanner):
                     if self.is_reserved(*waiting_position, current_robot_id=robot_id):
                         # check who reserved it and cancel his actions
                         if self.verbose:
-                            reserved_by = self.edge_hash_to_robot_id[waiting_position]
+                            reserved_by = self.edge_hash_to_robot_id[reservation_key(*waiting_position)]
                             self.log(f"waiting - cancel actions of {reserved_by:03}", robot_id)
                         collision_group, stopped_robots_count = self.handle_conflict(*waiting_position)
                         waiting_robots += stopped_robots_count
                         collision_groups.append(collision_group)
+                # the conflict checks above never touch the waiting cell itself (stopped robots reserve their own
+                # cells), so all waiting reservations can be added in one bulk update afterwards
+                self.add_waiting_reservations(last_loc, range(1, self.time_horizon + 1), robot_id)
+        return self.next_actions[0].tolist(), path_length_sum, waiting_robots, waiting_robot_ids
 
-                    self.add_reservation(*waiting_position, robot_id)
-        return self.next_actions[0], path_length_sum, waiting_robots, waiting_robot_ids
+    def precompute_paths_in_parallel(self, robot_order=None) -> dict[int, list[tuple[int, int]]]:
+        """
+        compute unconstrained shortest paths for all robots in a worker pool before the serial priority pass
+        robots whose paths don't cross any reservation are effectively independent of each other, so their
+        searches can run in parallel; every result is validated against the live reservation table before it
+        is used, a stale path only costs the fallback to the regular space-time search
+        :param robot_order: order in which the robots should be planned (priority)
+        :return: robot id: unconstrained shortest path, for every robot whose walk succeeded
+        """
+        curr_states = self.env.curr_states
+        goal_locations = self.env.goal_locations
+        jobs = []
+        for robot_id in robot_order or range(self.env.num_of_agents):
+            if goal_locations[robot_id]:
+                state = curr_states[robot_id]
+                jobs.append((robot_id, self.env, state.location, state.orientation,
+                             goal_locations[robot_id][0][0]))
+        precomputed_paths = {}
+        if not jobs:
+            return precomputed_paths
+        with multiprocessing.Pool(self.parallel_planning_processes) as pool:
+            for robot_id, path in pool.imap_unordered(_plan_unconstrained_path_for_args, jobs):
+                if path:
+                    precomputed_paths[robot_id] = path
+        return precomputed_paths
 
     def detour_planner(self, time_limit: int, robot_order=None) -> tuple[list[int], int, int, list[int]]:
         """
@@ -481,15 +866,15 @@ class SpaceTimeAStarPlanner(BasePlanner):
         canceled later)
         """
         start_time = time.time()
-        self.reservation = set()
         self.edge_hash_to_robot_id = {}
+        self.robot_to_reservations = collections.defaultdict(set)
 
         path_lengths = [0] * self.env.num_of_agents
         current_paths: list[Optional[any]] = [None] * self.env.num_of_agents
         waiting_robots = 0
         waiting_robot_ids = []
 
-        self.next_actions = [[Action.W.value] * len(self.env.curr_states) for _ in range(self.replanning_period)]
+        self.reset_next_actions()
         self.reserve_waiting_positions_for_all_robots()
 
         phase = DetourPlannerPhase.FIND_PATH
@@ -500,12 +885,13 @@ class SpaceTimeAStarPlanner(BasePlanner):
             self.log(f"phase {phase} {phase_count}__________________")
             for robot_id in robot_order or range(self.env.num_of_agents):
                 if time_limit and time.time() - start_time >= time_limit:
-                    return self.next_actions[0], sum(path_lengths), waiting_robots, waiting_robot_ids
+                    return self.next_actions[0].tolist(), sum(path_lengths), waiting_robots, waiting_robot_ids
                 if phase == DetourPlannerPhase.FIND_PATH and current_paths[robot_id] is not None:
                     continue
+                state = self.env.curr_states[robot_id]  # fetched once instead of per attribute chain below
                 path = self.space_time_plan(  # get the shortest possible path
-                    self.env.curr_states[robot_id].location,
-                    self.env.curr_states[robot_id].orientation,
+                    state.location,
+                    state.orientation,
                     self.env.goal_locations[robot_id][0][0],
                     robot_id
                 )
@@ -524,9 +910,7 @@ class SpaceTimeAStarPlanner(BasePlanner):
                     revoked_reservations = self.revoke_all_reservations_of_robot(
                         robot_id)  # cancel the waiting position
                     try:
-                        last_loc = self.env.curr_states[robot_id].location
-                        self.reserve_path_if_possible(last_loc, path, robot_id)
-                        self.update_next_actions(path, robot_id, update_wait_steps=True)
+                        self.reserve_path_and_update_actions(state.location, path, robot_id, update_wait_steps=True)
                         current_paths[robot_id] = path
                         path_lengths[robot_id] = len(path)
                         self.log(f"reserved path", robot_id)
@@ -536,8 +920,9 @@ class SpaceTimeAStarPlanner(BasePlanner):
                         # -> the robot would have to wait and the waiting cell is already reserved in some time step)
                         self.log(f"reserve path error", robot_id)
                         path = None
-                        for reservation in revoked_reservations:
-                            self.add_reservation(*reservation, robot_id)
+                        for key in revoked_reservations:  # restore the reservations that were revoked above
+                            self.edge_hash_to_robot_id[key] = robot_id
+                        self.robot_to_reservations[robot_id].update(revoked_reservations)
                 if not path:
                     self.log(f"no path", robot_id)
                     waiting_robots += 1
@@ -559,12 +944,13 @@ class SpaceTimeAStarPlanner(BasePlanner):
         #        self.log(f"path: {str([(convert_1d_to_2d_coordinate(e[0],self.env.cols), Orientation(e[1])) for e in current_paths[robot_id]])}", robot_id)
         #    self.log(str(sorted_reservations), robot_id)
         #    self.log(str(next_actions), robot_id)
-        return self.next_actions[0], sum(path_lengths), waiting_robots, waiting_robot_ids
+        return self.next_actions[0].tolist(), sum(path_lengths), waiting_robots, waiting_robot_ids
 
     def reserve_waiting_positions_for_all_robots(self):
+        curr_states = self.env.curr_states
+        time_steps = range(1, self.time_horizon + 1)
         for robot_id in range(self.env.num_of_agents):
-            for step in range(self.time_horizon):
-                self.add_reservation(self.env.curr_states[robot_id].location, -1, step + 1, robot_id)
+            self.add_waiting_reservations(curr_states[robot_id].location, time_steps, robot_id)
 
     def prereserve_cells_based_on_robot_positions(self, try_fix_stuck_robots):
         """
@@ -573,12 +959,17 @@ class SpaceTimeAStarPlanner(BasePlanner):
         "run away" from higher priority robots
         """
         robot_position_map = get_robot_position_map(self.env)
+        curr_states = self.env.curr_states
+        if self._forward_cell_lut is None or len(self._forward_cell_lut) != len(self.env.map) * 4:
+            self.build_forward_cell_lut()
+        forward_cell_lut = self._forward_cell_lut
         for robot_id in range(self.env.num_of_agents):
             # check if the robot is able to change its position in the next time step
             #  if not -> already reserve the cell the robot is currently in to prevent deadlocks
-            position, orientation = self.env.curr_states[robot_id].location, self.env.curr_states[robot_id].orientation
-            cell_in_front_of_robot = get_valid_forwards_neighbor_cell(self.env, position, orientation)
-            obstacle_in_front_of_robot = cell_in_front_of_robot is None
+            state = curr_states[robot_id]
+            position, orientation = state.location, state.orientation
+            cell_in_front_of_robot = forward_cell_lut[position * 4 + orientation]
+            obstacle_in_front_of_robot = cell_in_front_of_robot < 0
             if obstacle_in_front_of_robot:
                 # there is an obstacle in front of the robot -> reserve the cell the robot is currently in
                 self.add_reservation(position, -1, time_step=1, robot_index=robot_id)
@@ -595,48 +986,51 @@ class SpaceTimeAStarPlanner(BasePlanner):
                     self.add_reservation(position, -1, time_step=2, robot_index=robot_id)
                     self.add_reservation(position, -1, time_step=3, robot_index=robot_id)
 
-    def update_next_actions(self, path, robot_id, update_wait_steps=False):
+    def reserve_path_and_update_actions(self, last_loc, path, robot_id, update_wait_steps=False):
         """
-        update the next actions for the given robot based on the given path
-        :param path: the path
+        reserve the path and convert it to actions for the given robot in a single pass
+        (reserving and converting used to be separate methods that each walked the path once)
+        a read-only pre-check probes every target cell first, so a blocked path raises before anything
+        was mutated - no reservations to roll back, no planned actions touched
+        :param last_loc: current location of the robot
+        :param path: the path - list of (cell index, orientation) tuples
         :param robot_id: robot id zero based
         :param update_wait_steps: if the robot waits, this will be updated in the next actions (only necessary when
         next_steps was not initialized with the wait move
-        :return:
+        :return: the last reserved location
         """
-        # convert the path to actions
-        prev_loc = self.env.curr_states[robot_id].location
+        prev_loc = last_loc
         prev_ori = self.env.curr_states[robot_id].orientation
-        for i in range(min(len(path), self.replanning_period)):
-            new_location = path[i][0]
-            new_orientation = path[i][1]
-            if update_wait_steps and new_location == prev_loc and new_orientation == prev_ori:
-                self.next_actions[i][robot_id] = Action.W.value
-            elif new_location != prev_loc:
-                self.next_actions[i][robot_id] = Action.FW.value
-            elif new_orientation != prev_ori:
-                incr = new_orientation - prev_ori
-                if incr == 1 or incr == -3:
-                    self.next_actions[i][robot_id] = Action.CR.value
-                elif incr == -1 or incr == 3:
-                    self.next_actions[i][robot_id] = Action.CCR.value
-            prev_loc = new_location
-            prev_ori = new_orientation
-
-    def reserve_path_if_possible(self, last_loc, path, robot_id):
-        time_step = 1
+        action_steps = min(len(path), self.replanning_period)
+        path_length = len(path)
+        owner = self.edge_hash_to_robot_id
         for step in range(self.time_horizon):
-            if step < len(path):
+            # probing every target cell up front is much cheaper than reserving step by step and rolling
+            # all reservations back again on a conflict (raising matches what add_reservation would do)
+            cell = path[step][0] if step < path_length else path[-1][0]
+            if owner.get(reservation_key(cell, -1, step + 1), robot_id) != robot_id:
+                raise RuntimeError(f"robot {robot_id} tried to reserve cell {(cell, -1, step + 1)}, but it is "
+                                   f"already reserved by robot {owner[reservation_key(cell, -1, step + 1)]}")
+        for step in range(max(self.time_horizon, action_steps)):
+            if step < path_length:
                 p = path[step]
             else:
                 p = path[-1]  # take the last position if path ends before time horizon
-            try:
-                self.add_reservation(last_loc, p[0], time_step, robot_id, fail_if_already_reserved=True)
-            except RuntimeError as e:
-                self.revoke_all_reservations_of_robot(robot_id)
-                raise e
-            last_loc = p[0]
-            time_step += 1
+            if step < self.time_horizon:
+                self.add_reservation(last_loc, p[0], step + 1, robot_id)
+                last_loc = p[0]
+            if step < action_steps:  # convert the step to an action
+                new_location, new_orientation = p
+                if update_wait_steps and new_location == prev_loc and new_orientation == prev_ori:
+                    self.next_actions[step, robot_id] = Action.W.value
+                elif new_location != prev_loc:
+                    self.next_actions[step, robot_id] = Action.FW.value
+                else:
+                    # one table index instead of the four delta comparisons (delta 0 keeps the action as is)
+                    if (action := TURN_ACTIONS[(new_orientation - prev_ori) & 3]) is not None:
+                        self.next_actions[step, robot_id] = action
+                prev_loc = new_location
+                prev_ori = new_orientation
         return last_loc
 
     def add_reservation(self, start: int, end: int, time_step: int, robot_index: int, fail_if_already_reserved=False):
@@ -650,62 +1044,87 @@ class SpaceTimeAStarPlanner(BasePlanner):
         """
         if end == -1:
             end = start
-        cell_hash = (end, -1, time_step)
-        if (self.debug_mode or fail_if_already_reserved) and cell_hash in self.reservation and \
-                self.edge_hash_to_robot_id[cell_hash] != robot_index:
-            raise RuntimeError(f"robot {robot_index} tried to reserve cell {cell_hash}, but it is already reserved "
-                               f"by robot {self.edge_hash_to_robot_id[cell_hash]}")
-        self.reservation.add(cell_hash)  # reserve the end cell itself
-        self.edge_hash_to_robot_id[cell_hash] = robot_index  # to make it easy to lookup which robot reserved which cell
+        cell_hash = reservation_key(end, -1, time_step)
+        if (self.debug_mode or fail_if_already_reserved) and \
+                self.edge_hash_to_robot_id.get(cell_hash, robot_index) != robot_index:
+            raise RuntimeError(f"robot {robot_index} tried to reserve cell {(end, -1, time_step)}, but it is already "
+                               f"reserved by robot {self.edge_hash_to_robot_id[cell_hash]}")
+        self.edge_hash_to_robot_id[cell_hash] = robot_index  # reserves the end cell itself
+        self.robot_to_reservations[robot_index].add(cell_hash)
         if start != end:
-            edge_hash = (start, end, time_step)
-            self.reservation.add(edge_hash)  # reserve the edge
-            self.edge_hash_to_robot_id[
-                edge_hash] = robot_index  # to make it easy to lookup which robot reserved which edge
+            edge_hash = reservation_key(start, end, time_step)
+            self.edge_hash_to_robot_id[edge_hash] = robot_index  # reserves the edge
+            self.robot_to_reservations[robot_index].add(edge_hash)
+
+    def add_waiting_reservations(self, location: int, time_steps: range, robot_index: int):
+        """
+        reserve the cell a waiting robot stays on for all given timesteps at once
+        equivalent to one add_reservation(location, -1, step, ...) call per step, but a single C-level
+        set.update/dict.update instead of time_horizon method calls per waiting robot
+        :param location: cell index the robot waits on
+        :param time_steps: reservation timesteps
+        :param robot_index: id of the reserving robot
+        """
+        if self.debug_mode:  # keep the already-reserved check per step when debugging
+            for step in time_steps:
+                self.add_reservation(location, -1, step, robot_index)
+            return
+        keys = [reservation_key(location, -1, step) for step in time_steps]
+        self.edge_hash_to_robot_id.update((key, robot_index) for key in keys)
+        self.robot_to_reservations[robot_index].update(keys)
 
-    def handle_conflict(self, start: int, end: int, time_step: int, level=0) -> tuple[list[int], int]:
+    def handle_conflict(self, start: int, end: int, time_step: int) -> tuple[list[int], int]:
         """
         check who reserved the cell and cancel his actions and reservations - make him wait
-        if the stopped robot would collide with another robot -> stop the other robot also recursively
+        if the stopped robot would collide with another robot -> stop the other robot also
+        the cascade is driven by an explicit worklist instead of recursion, so long stop chains in
+        dense maps neither hit the recursion limit nor pay the per-call frame overhead
         :param start: start cell
         :param end: end cell
         :param time_step: time step
         :return: list of ids of robots that were stopped
         """
         # todo: check if there is an easy & quick reroute of the colliding robot possible
-        colliding_robot_id = self.edge_hash_to_robot_id[(start, end, time_step)]
-        collision_group_ids = [colliding_robot_id]
-        self.revoke_all_reservations_of_robot(colliding_robot_id)
-        stopped_robot_count = 1
-        for step in range(self.replanning_period):
-            self.next_actions[step][colliding_robot_id] = Action.W.value  # make colliding robot wait
-        for step in range(self.time_horizon):
-            # if the colliding robot which will now wait would collide with another robot -> stop the other robot also
-            stopped_robot_location = self.env.curr_states[colliding_robot_id].location
-            wait_cell_hash_of_stopped_robot = (stopped_robot_location, -1, step)
-            if self.is_reserved(*wait_cell_hash_of_stopped_robot, current_robot_id=colliding_robot_id):
-                cell_was_reserved_by = self.edge_hash_to_robot_id[wait_cell_hash_of_stopped_robot]
-                if self.debug_mode and level >= 50:
-                    print("recursion limit reached")
-                new_collision_group_ids, new_stopped_robot_count = self.handle_conflict(
-                    *wait_cell_hash_of_stopped_robot, level=level + 1)
-                stopped_robot_count += new_stopped_robot_count
-                collision_group_ids.extend(new_collision_group_ids)
-            self.add_reservation(*wait_cell_hash_of_stopped_robot, colliding_robot_id)
-        return collision_group_ids, stopped_robot_count
-
-    def revoke_all_reservations_of_robot(self, robot_id: int) -> list[tuple[int, int, int]]:
+        collision_group_ids = []
+        # worklist entries: ("conflict", start, end, time_step) stops the robot holding that reservation,
+        # ("reserve", robot_id, step) continues reserving a stopped robot's waiting cell from step onwards
+        stack: list[tuple] = [("conflict", start, end, time_step)]
+        while stack:
+            entry = stack.pop()
+            if entry[0] == "conflict":
+                colliding_robot_id = self.edge_hash_to_robot_id[reservation_key(entry[1], entry[2], entry[3])]
+                collision_group_ids.append(colliding_robot_id)
+                self.revoke_all_reservations_of_robot(colliding_robot_id)
+                self.next_actions[:, colliding_robot_id] = Action.W.value  # make colliding robot wait
+                stack.append(("reserve", colliding_robot_id, 0))
+            else:
+                _, robot_id, step = entry
+                stopped_robot_location = self.env.curr_states[robot_id].location
+                while step < self.time_horizon:
+                    # if the stopped robot which will now wait would collide with another robot
+                    # -> stop the other robot also before reserving this step
+                    if self.is_reserved(stopped_robot_location, -1, step, current_robot_id=robot_id):
+                        stack.append(("reserve", robot_id, step))
+                        stack.append(("conflict", stopped_robot_location, -1, step))
+                        break
+                    self.add_reservation(stopped_robot_location, -1, step, robot_id)
+                    step += 1
+        return collision_group_ids, len(collision_group_ids)
+
+    def revoke_all_reservations_of_robot(self, robot_id: int) -> list[int]:
         """
         remove all reservations of a robot
         :param robot_id: id of the robot
-        :return: list of revoked reservations
+        :return: list of revoked reservation keys
         """
         revoked_reservations = []
-        for edge_hash, r_id in list(self.edge_hash_to_robot_id.items()):
-            if r_id == robot_id:
+        owner = self.edge_hash_to_robot_id
+        for edge_hash in self.robot_to_reservations.pop(robot_id, ()):
+            # another robot may have taken the key over since (e.g. through a conflict cascade)
+            # -> only revoke keys the robot still owns, exactly like the old full-table scan did
+            if owner.get(edge_hash) == robot_id:
                 revoked_reservations.append(edge_hash)
-                self.reservation.remove(edge_hash)
-                del self.edge_hash_to_robot_id[edge_hash]
+                del owner[edge_hash]
         return revoked_reservations
 
 
@@ -720,3 +1139,55 @@ def get_precomputed_distance_map(env: any, start: int, start_orientation: int, e
     distance_map = DistanceMap(end, env)
     distance_map.get_distance(env, start, start_orientation)
     return distance_map
+
+
+def _get_precomputed_distance_map_for_args(args: tuple) -> DistanceMap:
+    # single-argument wrapper so get_precomputed_distance_map can be used with Pool.imap_unordered
+    return get_precomputed_distance_map(*args)
+
+
+def _plan_unconstrained_path_for_args(args: tuple) -> tuple[int, Optional[list[tuple[int, int]]]]:
+    """
+    compute the shortest path for one robot while ignoring all reservations - runs in a worker process,
+    so it only sees the static map and walks the distance map downhill like walk_distance_map does
+    :param args: (robot id, env, start cell, start orientation, end cell)
+    :return: robot id and the path (excluding the start state), or None if the goal is unreachable
+    """
+    robot_id, env, position, orientation, end = args
+    distances = DistanceMap(end, env).distance_map
+    if distances[position * 4 + orientation] is None:
+        return robot_id, None  # the goal is not reachable from here
+    path = []
+    while position != end:
+        distance = distances[position * 4 + orientation]
+        for neighbor_location, neighbor_direction in get_neighbors(env, position, orientation):
+            if distances[neighbor_location * 4 + neighbor_direction] == distance - 1:
+                position, orientation = neighbor_location, neighbor_direction
+                path.append((position, orientation))
+                break
+        else:
+            return robot_id, None
+    return robot_id, path
+
+
+_restart_worker_planner: Optional[SpaceTimeAStarPlanner] = None
+
+
+def _initialize_restart_worker(env: any, planner_args: dict, distance_maps: dict):
+    # runs once per worker process - builds the planner that all priority order evaluations of this worker share
+    global _restart_worker_planner
+    _restart_worker_planner = SpaceTimeAStarPlanner(**planner_args)
+    _restart_worker_planner.env = env
+    _restart_worker_planner.distance_maps = distance_maps
+
+
+def _evaluate_priority_order(args: tuple) -> tuple:
+    """
+    evaluate one restart priority order in a worker process
+    :param args: iteration count, time limit and the priority order to evaluate
+    :return: planned next actions, path_length_sum, number of waiting robots, processing time
+    """
+    iteration, time_limit, priority_order = args
+    _, path_length_sum, waiting_robots_count, _, processing_time = _restart_worker_planner.call_low_level_planner(
+        iteration, time_limit, priority_order)
+    return _restart_worker_planner.next_actions, path_length_sum, waiting_robots_count, processing_time
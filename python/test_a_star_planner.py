@@ -2,18 +2,24 @@ import os
 import random
 import time
 import unittest
-from copy import deepcopy
-from queue import PriorityQueue
 
 from matplotlib import pyplot as plt
 
 from planner_space_time_a_star import SpaceTimeAStarPlanner
 from python.test_util_functions import plot_distance_map
-from test_utils import grids_to_env, update_env, print_grid, animate_grid, \
+from test_utils import grids_to_env, update_env, print_grid, animate_grid, snapshot_env, \
     get_test_env_and_targets_from_config_file
 from util import get_neighbors, DistanceMap, convert_1d_to_2d_coordinate
 from models import Env, Action, Heuristic, AstarHighLevelPlannerType
 
+VIZ_TESTS = os.environ.get("VIZ_TESTS") == "1"  # set VIZ_TESTS=1 to render grids and gifs while testing
+if not VIZ_TESTS:
+    # rebinding the names to a no-op keeps the call sites unchanged and skips even the call overhead
+    def _no_viz(*_args, **_kwargs):
+        pass
+
+    print_grid = animate_grid = _no_viz
+
 
 class PlannerTest(unittest.TestCase):
     def setUp(self):
@@ -177,14 +183,14 @@ class PlannerTest(unittest.TestCase):
         env = grids_to_env(grid, goal_grid, "multiple_steps_multiple_robots")
         planner = SpaceTimeAStarPlanner(replanning_period=2)
         planner.env = env
-        all_envs = [deepcopy(env)]
+        all_envs = [snapshot_env(env)]
         print_grid(env)
         while True:
             actions = planner.plan(None)
             env = update_env(env, actions)
             print([Action(a).name for a in actions])
             print_grid(env)
-            all_envs.append(deepcopy(env))
+            all_envs.append(snapshot_env(env))
             if all(a == Action.W.value for a in actions):
                 break
         animate_grid(all_envs)
@@ -221,11 +227,11 @@ class PlannerTest(unittest.TestCase):
             planner = SpaceTimeAStarPlanner(replanning_period=replanning_period, time_horizon=time_horizon,
                                             visualize=False, restarts=True)
             planner.env = env
-            all_envs = [deepcopy(env)]
+            all_envs = [snapshot_env(env)]
             actions = planner.plan(None)
             print([Action(a) for a in actions])
             env = update_env(env, actions)
-            all_envs.append(deepcopy(env))
+            all_envs.append(snapshot_env(env))
             self.assertEqual(Action(actions[0]), expected_actions[0])
             self.assertEqual(Action(actions[1]), expected_actions[1])
             for i in range(20):
@@ -233,7 +239,7 @@ class PlannerTest(unittest.TestCase):
                 # print([Action(a) for a in actions])
                 env = update_env(env, actions)
                 # print_grid(env)
-                all_envs.append(deepcopy(env))
+                all_envs.append(snapshot_env(env))
                 if all(a == Action.W.value for a in actions):
                     break
             animate_grid(all_envs)
@@ -250,16 +256,16 @@ class PlannerTest(unittest.TestCase):
         env = grids_to_env(grid, goal_grid, "small_hallway_with_right_padding")
         planner = SpaceTimeAStarPlanner(replanning_period=99, time_horizon=99, restarts=False, visualize=False)
         planner.env = env
-        all_envs = [deepcopy(env)]
+        all_envs = [snapshot_env(env)]
         actions = planner.plan(None)
         self.assertEqual(Action(actions[0]), Action.W)
         self.assertIn(Action(actions[1]), [Action.CR, Action.CCR])
         env = update_env(env, actions)
-        all_envs.append(deepcopy(env))
+        all_envs.append(snapshot_env(env))
         while True:
             actions = planner.plan(None)
             env = update_env(env, actions)
-            all_envs.append(deepcopy(env))
+            all_envs.append(snapshot_env(env))
             if all(a == Action.W.value for a in actions):
                 break
         animate_grid(all_envs)
@@ -282,15 +288,15 @@ class PlannerTest(unittest.TestCase):
         env = grids_to_env(grid, goal_grid, "small_hallway")
         planner = SpaceTimeAStarPlanner(replanning_period=99, time_horizon=99, restarts=True, visualize=False)
         planner.env = env
-        all_envs = [deepcopy(env)]
+        all_envs = [snapshot_env(env)]
         actions = planner.plan(None)
         print([Action(a) for a in actions])
         env = update_env(env, actions)
-        all_envs.append(deepcopy(env))
+        all_envs.append(snapshot_env(env))
         while True:
             actions = planner.plan(None)
             env = update_env(env, actions)
-            all_envs.append(deepcopy(env))
+            all_envs.append(snapshot_env(env))
             if all(a == Action.W.value for a in actions):
                 break
         animate_grid(all_envs)
@@ -325,7 +331,7 @@ class PlannerTest(unittest.TestCase):
             print([Action(a).name for a in actions])
             env = update_env(env, actions)
             print_grid(env)
-            all_envs.append(deepcopy(env))
+            all_envs.append(snapshot_env(env))
             if all(a == Action.W.value for a in actions):
                 break
         animate_grid(all_envs, "without_restarts")
@@ -342,13 +348,13 @@ class PlannerTest(unittest.TestCase):
                                         high_level_planner=AstarHighLevelPlannerType.PRIORITY_DETOUR)
         planner.env = env
         print_grid(env)
-        all_envs = [deepcopy(env)]
+        all_envs = [snapshot_env(env)]
         for _ in range(100):
             actions = planner.plan(None)
             print([Action(a).name for a in actions])
             env, next_task_index = update_env(env, actions, tasks, next_task_index)
             #print_grid(env)
-            all_envs.append(deepcopy(env))
+            all_envs.append(snapshot_env(env))
             if all(a == Action.W.value for a in actions):
                 break
         animate_grid(all_envs)
@@ -360,7 +366,7 @@ class PlannerTest(unittest.TestCase):
         print_grid(env)
         planner = SpaceTimeAStarPlanner(replanning_period=1, time_horizon=8, restarts=False, heuristic=Heuristic.TRUE_DISTANCE)
         planner.env = env
-        #planner.precompute_heuristic_values()
+        planner.precompute_distance_maps(preprocess_time_limit=30)
         action = planner.plan(None)
         print(action)
         env, next_task_index = update_env(env, action, tasks, next_task_index)
@@ -373,14 +379,13 @@ class PlannerTest(unittest.TestCase):
         print(convert_1d_to_2d_coordinate(1216, env.cols))
         with open("/Users/maxehrlicherschmidt/projects/swp-robot-runners/distance_map.pkl", "rb") as f:
             import pickle
-            target, close_list, distances, last_start = pickle.load(f)
+            # older pickles also carry the open/close state of the incremental search the
+            # distance map used before it became a single eager bfs - only the distances matter now
+            target, _close_list, distances, _last_start = pickle.load(f)
         distance_map = DistanceMap(1216, env)
         distance_map.target = target
         print(target)
-        distance_map.close_list = close_list
         distance_map.distance_map = distances
-        distance_map.last_start = last_start
-        distance_map.open_list = PriorityQueue()
 
         plot_distance_map(distance_map.distance_map, env)
 
@@ -396,16 +401,19 @@ class PlannerTest(unittest.TestCase):
             env, tasks = get_test_env_and_targets_from_config_file(path)
             next_task_index = env.num_of_agents
             processing_times = {}
+            shared_distance_maps = {}  # built once per goal cell and shared across the compared planners
             for heuristic in [Heuristic.MANHATTAN, Heuristic.TRUE_DISTANCE]:
                 planner = SpaceTimeAStarPlanner(replanning_period=replanning_period, time_horizon=time_horizon, restarts=False,
                                                           heuristic=heuristic, )
-                local_env = deepcopy(env)
+                planner.distance_maps = shared_distance_maps
+                local_env = snapshot_env(env)
                 planner.env = local_env
                 for _ in range(100):
-                    # measure time for planning
-                    start = time.time()
+                    # measure time for planning - perf_counter_ns is monotonic and not limited to the
+                    # millisecond resolution time.time has on some platforms
+                    start = time.perf_counter_ns()
                     actions = planner.plan(None)
-                    planning_time = time.time() - start
+                    planning_time = (time.perf_counter_ns() - start) * 1e-9
                     processing_times.setdefault(heuristic, []).append(planning_time)
                     local_env, next_task_index = update_env(local_env, actions, tasks, next_task_index)
 
@@ -421,14 +429,14 @@ class PlannerTest(unittest.TestCase):
             # Width of a bar
             width = 0.35
 
-            # Creating bars for each heuristic at each iteration
-            for i in range(num_iterations):
-                for j, heuristic in enumerate(Heuristic):
-                    if heuristic in processing_times:
-                        # Calculate the position of the bar for this heuristic at this iteration
-                        x_pos = i + (j - len(Heuristic)/2) * width
-                        # Draw the bar
-                        ax.bar(x_pos, processing_times[heuristic][i], width, color=colors[j], label=heuristic.name if i == 0 else "")
+            # Creating the bars for each heuristic - one vectorized bar call per heuristic instead of
+            # one matplotlib call per iteration and heuristic
+            import numpy as np
+            iterations = np.arange(num_iterations)
+            for j, heuristic in enumerate(Heuristic):
+                if heuristic in processing_times:
+                    x_pos = iterations + (j - len(Heuristic) / 2) * width
+                    ax.bar(x_pos, processing_times[heuristic], width, color=colors[j], label=heuristic.name)
 
             # Add some text for labels, title, and custom x-axis tick labels, etc.
             ax.set_xlabel('Iteration')
@@ -451,5 +459,6 @@ class PlannerTest(unittest.TestCase):
             ax.legend(handles=legend_elements)
 
             plt.grid(True)
-            plt.show()
+            if VIZ_TESTS:
+                plt.show()
 
@@ -44,6 +44,20 @@ def grids_to_env(grid: list[list[Union[int, str]]], goal_grid: list[list[int]],
     return env
 
 
+def snapshot_env(env: Env) -> Env:
+    """
+    cheap copy of the env for animation frames: copies the mutable robot states and goal lists and
+    shares the immutable grid, instead of letting deepcopy recurse through the whole object graph
+    :param env: env object
+    :return: snapshot that stays unchanged when the original env is updated further
+    """
+    states = [State(location=s.location, orientation=s.orientation, timestep=s.timestep) for s in env.curr_states]
+    goals = [list(goal_list) for goal_list in env.goal_locations]
+    return Env(cols=env.cols, rows=env.rows, map=env.map, map_name=env.map_name,
+               num_of_agents=env.num_of_agents, curr_timestep=env.curr_timestep,
+               curr_states=states, goal_locations=goals)
+
+
 def update_env(env: Env, actions: list[int], tasks: list[int] = None, next_task_index: int = None) -> Union[Env, tuple[Env, int]]:
     robot_map = [None for _ in range(env.cols * env.rows)]
     for i, state in enumerate(env.curr_states):
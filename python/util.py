@@ -1,3 +1,4 @@
+from collections import deque
 from typing import Optional
 from queue import PriorityQueue
 
@@ -7,32 +8,35 @@ from models import Env, Action
 class DistanceMap:
     """
     A class that can be used to calculate the shortest distance from a given cell to a target cell.
-    It uses the A* algorithm to calculate the distance.
-    The distances are saved. If a distance is requested for a cell that hasn't been visited yet, the distance is
-    calculated efficiently by using the previous distances.
+    The whole table is built once with a breadth-first search backwards from the target over a flat list
+    (every move costs one step, so BFS yields the same distances the previous incremental A* produced,
+    but with a plain deque instead of a priority queue and without per-state heuristic calls).
+    Requesting a distance afterwards is a single list lookup.
     """
 
     def __init__(self, target: int, env: Env):
         number_of_cells = len(env.map)
         self.target: int = target
-        self.open_list: PriorityQueue[
-            tuple[int, int, int, int, int]] = PriorityQueue()  # f, h, g, position, orientation
-        self.close_list: set = set()
         self.distance_map: list[Optional[int]] = [None] * (number_of_cells * 4)
-        self.last_start = None
+        distance_map = self.distance_map
 
-        # add starting point for search (the target cell)
+        # breadth-first search from the target cell over position-orientation states
+        queue = deque()
         for orientation in range(4):
-            g = 0
-            h = 0  # those values will be calculated when the start pos is known, no need to do it now
-            f = 0  # those values will be calculated when the start pos is known, no need to do it now
-            self.open_list.put((f, h, g, self.target, orientation))
-            self.distance_map[self.target * 4 + orientation] = 0
+            distance_map[target * 4 + orientation] = 0
+            queue.append((target, orientation))
+        while queue:
+            position, orientation = queue.popleft()
+            distance = distance_map[position * 4 + orientation] + 1
+            for neighbor_position, neighbor_orientation in get_neighbors(env, position, orientation, reverse=True):
+                pos_ori_hash = neighbor_position * 4 + neighbor_orientation
+                if distance_map[pos_ori_hash] is None:
+                    distance_map[pos_ori_hash] = distance
+                    queue.append((neighbor_position, neighbor_orientation))
 
     def get_distance(self, env: Env, start_cell: int, start_orientation: int) -> int:
         """
         Returns the shortest distance from start_cell to the target cell.
-        Only calculates the distance if it hasn't been calculated before.
         :param env:
         :param start_cell:
         :param start_orientation:
@@ -40,52 +44,7 @@ class DistanceMap:
         """
         if (dist := self.distance_map[start_cell * 4 + start_orientation]) is not None:
             return dist
-
-        if self.open_list.empty() and self.close_list:
-            raise RuntimeError(f"no valid path found from {start_cell} to {self.target}")
-
-        if self.last_start != start_cell:
-            # update all h values in open_list
-            new_open_list = PriorityQueue()
-            while not self.open_list.empty():
-                f, h, g, position, orientation = self.open_list.get()
-                h = getManhattanDistance(env, position, start_cell)
-                f = g + h
-                new_open_list.put((f, h, g, position, orientation))
-            self.open_list = new_open_list
-            self.last_start = start_cell
-
-        # do backwards A* to get distance (target -> start_cell)
-        target = start_cell
-        target_orientation = start_orientation
-        solution_found = None
-        while not self.open_list.empty():
-            f, h, g, position, orientation = (self.open_list.get())
-            self.close_list.add(position * 4 + orientation)
-            neighbors = get_neighbors(env, position, orientation, reverse=True)
-            for neighbor in neighbors:
-                neighbor_position, neighbor_orientation = neighbor
-                if (neighbor_position * 4 + neighbor_orientation) in self.close_list:
-                    continue
-                neighbor_g = g + 1
-                neighbor_h = getManhattanDistance(env, neighbor_position, target)
-                neighbor_f = neighbor_g + neighbor_h
-                self.open_list.put((neighbor_f, neighbor_h, neighbor_g, neighbor_position, neighbor_orientation))
-
-                pos_ori_hash = neighbor_position * 4 + neighbor_orientation
-                shortest_distance = self.distance_map[pos_ori_hash]
-                if shortest_distance is None or neighbor_g < shortest_distance:
-                    self.distance_map[pos_ori_hash] = neighbor_g
-                if neighbor_position == target and neighbor_orientation == target_orientation:
-                    solution_found = neighbor_g
-            if solution_found is not None:
-                return solution_found
-        # something went wrong
-        with open("distance_map.pkl", "wb") as f:
-            import pickle
-            pickle.dump((self.target, self.close_list, self.distance_map, self.last_start), f)
-        raise RuntimeError(f"no valid path found from {start_cell} to {self.target}. "
-                           f"Distance map was saved as distance_map.pkl for debugging.")
+        raise RuntimeError(f"no valid path found from {start_cell} to {self.target}")
 
 
 def a_star(env, start: int, start_direct: int, end: int):
@@ -59,16 +59,19 @@ class AStarVisualizer:
         if current_pos not in self.lowest_g_values or g < self.lowest_g_values[current_pos]:
             self.lowest_g_values[current_pos] = g  # found a lower g value
 
-        for node in open_list.queue:
+        if not self.GENERATE_ANIMATIONS:
+            return  # everything below builds per-frame grid snapshots that only the animation consumes
+
+        for node in open_list:  # open_list is a plain heapq-managed list of (f, h, pos, ori, g) tuples
             f = node[0]
-            pos = node[3][0]
+            pos = node[2]
             lowest_f = self.lowest_f_values.get(pos, math.inf)
             if f < lowest_f:
                 self.lowest_f_values[pos] = f
             current_lowest_f = self.current_f_values.get(pos, math.inf)
             if f < current_lowest_f:
                 self.current_f_values[pos] = f
-            ori = node[3][1]
+            ori = node[3]
             current_lowest_f = self.min_f_values_v2.get((pos, ori), math.inf)
             if f < current_lowest_f:
                 self.min_f_values_v2[(pos, ori)] = f